@@ -1,72 +1,485 @@
 import logging
-import csv
-from io import StringIO, BytesIO
+import base64
+import hashlib
 import os
+import re
+import queue
+import socket
+import threading
+import time
 import requests
 import pyodbc
-from azure.core.exceptions import ResourceNotFoundError, ClientAuthenticationError
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
-from simple_salesforce import Salesforce, SalesforceError
-from datetime import datetime, timezone, timedelta
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+from urllib.parse import quote
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError, ClientAuthenticationError
+from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient, ContentSettings, BlobBlock
+from simple_salesforce import Salesforce, SalesforceError, SalesforceExpiredSession
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks read from the Salesforce VersionData response stream.
+# 1 MiB keeps the number of Python-level read/write iterations low for multi-MB files.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# (connect, read) timeouts in seconds for VersionData requests. The read timeout applies to each
+# socket read, not the whole file, so it only fires when the stream stalls; a stalled download
+# then fails into the resume/retry path instead of holding a worker thread indefinitely.
+DOWNLOAD_TIMEOUT = (10, 120)
+
+# Files of at least LARGE_FILE_THRESHOLD bytes are transferred as LARGE_FILE_PART_SIZE parts:
+# up to LARGE_FILE_PARALLEL_PARTS ranged downloads run at once, each staged as one Azure block,
+# so a single large file uses several TCP connections and is never held in memory as a whole.
+LARGE_FILE_THRESHOLD = 32 * 1024 * 1024
+LARGE_FILE_PART_SIZE = 8 * 1024 * 1024
+LARGE_FILE_PARALLEL_PARTS = 4
+
+# Size of the AzureBlobUrl column (NVARCHAR(1000) in db/create_tables.sql and #StagingContentVersion).
+# Titles are cut so that their percent-encoded form stays within MAX_BLOB_TITLE_URL_LENGTH; a
+# non-ASCII character can take up to 12 characters once encoded (4 UTF-8 bytes as %XX each).
+AZURE_BLOB_URL_MAX_LENGTH = 1000
+MAX_BLOB_TITLE_URL_LENGTH = 300
+
+# ContentVersion fields the file sync actually reads. Every extra column (Description,
+# TextPreview, TagCsv, ...) adds to the Bulk API result size and to the memory held per record,
+# so callers that want more metadata pass it explicitly via extra_fields.
+CONTENT_VERSION_FIELDS = (
+    'Id', 'ContentDocumentId', 'Title', 'FileExtension', 'VersionDataUrl',
+    'SystemModstamp', 'ContentSize', 'Checksum'
+)
+
+# ContentDocumentLink fields selected by the link sync, in the column order of [dbo].[ContentDocumentLink]
+# and of the rows passed to _execute_cdl_db_batch.
+CONTENT_DOCUMENT_LINK_FIELDS = (
+    'Id', 'LinkedEntityId', 'ContentDocumentId', 'IsDeleted', 'SystemModstamp', 'ShareType', 'Visibility'
+)
+
+# Fields only needed while transferring the file. They are dropped from each record once it has
+# been processed so the list returned to the caller does not keep them alive for every file.
+# 'attributes' is the per-record type/url dict the Bulk API adds to every result row.
+_CONTENT_VERSION_TRANSFER_ONLY_FIELDS = ('attributes', 'VersionDataUrl', 'ContentSize', 'Checksum')
+
+# SOQL queries are built once at import; only the field list (when extra_fields is given)
+# and the start timestamp are filled in per run.
+_CONTENT_VERSION_SELECT = ', '.join(CONTENT_VERSION_FIELDS)
+_CONTENT_VERSION_SOQL_TEMPLATE = (
+    "SELECT {fields} FROM ContentVersion "
+    "WHERE SystemModstamp > {ts} ORDER BY SystemModstamp ASC"
+)
+_CONTENT_DOCUMENT_LINK_SOQL_TEMPLATE = (
+    f"SELECT {', '.join(CONTENT_DOCUMENT_LINK_FIELDS)} "
+    "FROM ContentDocumentLink WHERE SystemModstamp > {ts} ORDER BY SystemModstamp ASC"
+)
+
+# ContainerClients built by _get_container_client, keyed by account, container and credential digest.
+_CONTAINER_CLIENTS = {}
+
+# Idle Azure SQL Database connections, keyed by a SHA-256 digest of the connection string (which
+# holds the password), kept between syncs by _acquire_sql_connection / _release_sql_connection.
+_SQL_CONNECTION_POOLS = {}
+
+# Logged-in Salesforce clients built by _get_salesforce_client, keyed by user, login domain and
+# credential digest, as (client, login time from time.monotonic()).
+_SALESFORCE_CLIENTS = {}
+
+# (account, container) pairs already ensured to exist by this process. The Functions worker stays
+# warm between timer runs, so only the first run after a cold start pays the create_container call.
+_VERIFIED_CONTAINERS = set()
+
+# SOQL dateTime literal, e.g. 2024-01-01T00:00:00Z or 2024-01-01T00:00:00.000+00:00
+_SF_DATETIME_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,3})?(Z|[+-]\d{2}:\d{2})')
+
+# Salesforce field API name (standard, custom '__c' and namespaced), optionally as a relationship
+# path such as Owner.Name; extra_fields are interpolated into the SOQL text, so nothing else is accepted.
+_SF_FIELD_NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*')
+
+# Characters removed from titles when building blob names: everything except
+# alphanumerics (str.isalnum), '_', ' ', '.' and '-'
+_UNSAFE_FILENAME_CHARS_RE = re.compile(r'[^\w .-]+')
 
 def helper_code() -> None:
     logging.info("Helper code function successfully executed. AB")
-    
 
-def _execute_db_batch(cursor, cnxn, batch_data):
+
+def _get_positive_int_env(var_name, default):
+    """
+    Reads a positive integer setting from an environment variable.
+    Returns default if the variable is not set, or (with a warning) if it is not a positive integer.
+    """
+    value_str = os.environ.get(var_name)
+    if value_str is None:
+        return default
+    try:
+        value = int(value_str)
+        if value <= 0:
+            raise ValueError("Value must be a positive integer.")
+        return value
+    except ValueError as e:
+        logger.warning("Invalid %s environment variable '%s'. Defaulting to %s. Error: %s", var_name, value_str, default, e)
+        return default
+
+def _get_container_client(account_name, container_name, connection_string=None, account_key=None):
+    """
+    Returns a ContainerClient for the given container, using the connection string if set and the
+    account key otherwise. The client is built once per process for each account, container and
+    credential, so later syncs reuse its SDK pipeline and connection pool instead of rebuilding them.
+    The credential is only part of the cache key as a SHA-256 digest.
+    """
+    secret = connection_string or account_key or ''
+    cache_key = (account_name, container_name, hashlib.sha256(secret.encode()).hexdigest())
+    container_client = _CONTAINER_CLIENTS.get(cache_key)
+    if container_client is None:
+        # Streamed uploads bigger than one PUT are split into blocks of the same size as the
+        # ranged parts used for large files (see _transfer_in_parallel_parts). The single-PUT limit
+        # is lowered to the same size, as the SDK buffers a single-PUT upload in memory as a whole.
+        blob_client_options = {'max_block_size': LARGE_FILE_PART_SIZE,
+                               'max_single_put_size': LARGE_FILE_PART_SIZE}
+        if connection_string:
+            blob_service_client = BlobServiceClient.from_connection_string(connection_string, **blob_client_options)
+        else:
+            account_url = f"https://{account_name}.blob.core.windows.net"
+            blob_service_client = BlobServiceClient(account_url=account_url, credential=account_key,
+                                                    **blob_client_options)
+        container_client = blob_service_client.get_container_client(container_name)
+        _CONTAINER_CLIENTS[cache_key] = container_client
+    return container_client
+
+def _get_salesforce_client(username, password, security_token, sandbox=False):
+    """
+    Returns a logged-in Salesforce client, reusing the one from an earlier sync in this process while
+    it is younger than SF_SESSION_MAX_AGE_SECONDS (default 28800, i.e. 8 hours, several hourly timer
+    periods), so warm timer runs skip the login round-trip.
+    A session that Salesforce has expired or revoked in the meantime is rejected on the first query;
+    _start_bulk_query then logs in again and retries.
+    The password and security token are only part of the cache key as a SHA-256 digest.
+    """
+    domain = 'test' if sandbox else 'login'
+    secret = f"{password or ''}{security_token or ''}"
+    cache_key = (username, domain, hashlib.sha256(secret.encode()).hexdigest())
+    max_age = _get_positive_int_env('SF_SESSION_MAX_AGE_SECONDS', 28800)
+    cached = _SALESFORCE_CLIENTS.get(cache_key)
+    if cached is not None and time.monotonic() - cached[1] < max_age:
+        return cached[0]
+    sf = Salesforce(
+        username=username,
+        password=password,
+        security_token=security_token,
+        domain=domain
+    )
+    _SALESFORCE_CLIENTS[cache_key] = (sf, time.monotonic())
+    return sf
+
+def _discard_salesforce_client(sf):
+    """
+    Drops sf from the client cache, e.g. after a Salesforce error that may mean its session expired
+    or was revoked, so the next sync logs in again.
+    """
+    for cache_key, (cached_sf, _) in list(_SALESFORCE_CLIENTS.items()):
+        if cached_sf is sf:
+            _SALESFORCE_CLIENTS.pop(cache_key, None)
+
+def _is_expired_session_error(error):
+    """
+    Returns True if error is Salesforce rejecting the session: SalesforceExpiredSession (HTTP 401) or
+    the Bulk API's HTTP 400 with exceptionCode InvalidSessionId.
+    """
+    return isinstance(error, SalesforceExpiredSession) or 'InvalidSessionId' in str(getattr(error, 'content', ''))
+
+def _start_bulk_query(sf, object_name, soql_query, username, password, security_token, sandbox=False):
+    """
+    Starts a lazy Bulk API query for object_name and returns (sf, result sets). If the session of a
+    cached login has expired or been revoked, the client is discarded, a fresh login is made and the
+    query is retried once, so the run goes ahead instead of failing until the next timer run.
+    The returned sf is the client the query ran on; callers must use it from then on.
+    """
+    try:
+        return sf, getattr(sf.bulk, object_name).query(soql_query, lazy_operation=True)
+    except SalesforceError as e:
+        if not _is_expired_session_error(e):
+            raise
+        logger.warning("Salesforce session expired or was revoked; logging in again and retrying the %s query.", object_name)
+        _discard_salesforce_client(sf)
+        sf = _get_salesforce_client(username, password, security_token, sandbox)
+        return sf, getattr(sf.bulk, object_name).query(soql_query, lazy_operation=True)
+
+def _sql_connection_pool(connection_string):
+    """
+    Returns the LIFO queue of idle connections for connection_string, creating it on first use.
+    The connection string is only part of the key as a SHA-256 digest.
+    """
+    cache_key = hashlib.sha256(connection_string.encode()).hexdigest()
+    return _SQL_CONNECTION_POOLS.setdefault(cache_key, queue.LifoQueue())
+
+def _acquire_sql_connection(connection_string):
+    """
+    Returns an Azure SQL Database connection for connection_string, reusing an idle one left by an
+    earlier sync in this process if it is still alive, so warm timer runs skip the TCP + TLS + login
+    handshake. Connections must be handed back with _release_sql_connection.
+    """
+    pool = _sql_connection_pool(connection_string)
+    while True:
+        try:
+            cnxn = pool.get_nowait()
+        except queue.Empty:
+            return pyodbc.connect(connection_string)
+        try:
+            cnxn.cursor().execute("SELECT 1").fetchall()
+            return cnxn
+        except pyodbc.Error as e:
+            logger.info("Discarding stale pooled Azure SQL Database connection: %s", e)
+            try:
+                cnxn.close()
+            except pyodbc.Error:
+                pass
+
+def _release_sql_connection(connection_string, cnxn):
+    """
+    Rolls back anything left uncommitted on cnxn and returns it to the pool for the next sync.
+    A connection that cannot be rolled back is closed instead.
+    """
+    try:
+        cnxn.rollback()
+    except pyodbc.Error as e:
+        logger.warning("Closing Azure SQL Database connection instead of pooling it: %s", e)
+        try:
+            cnxn.close()
+        except pyodbc.Error:
+            pass
+        return
+    _sql_connection_pool(connection_string).put(cnxn)
+
+def _to_sf_iso(dt):
+    """
+    Formats a datetime as a Salesforce dateTime string with milliseconds, e.g. '2024-01-01T00:00:00.000Z'.
+    Aware datetimes are converted to UTC first; naive ones are taken to already be UTC, as returned by
+    the CAST(... AT TIME ZONE 'UTC' AS DATETIME) in _get_last_sync_timestamp_from_db.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + f'{dt.microsecond // 1000:03d}Z'
+
+def _canonical_sf_timestamp(timestamp):
+    """
+    Checks that timestamp is a valid Salesforce (SOQL) dateTime literal such as '2024-01-01T00:00:00Z'
+    and returns it in the one form the sync uses everywhere: UTC with milliseconds and a 'Z' suffix
+    (e.g. '2024-01-01T00:00:00.000Z'), the same form as the timestamps read back from SyncState.
+    The value is interpolated into the SOQL WHERE clause, so anything else is rejected here with a
+    ValueError instead of being sent to Salesforce as a Bulk API job that is bound to fail.
+    """
+    if not isinstance(timestamp, str) or not _SF_DATETIME_RE.fullmatch(timestamp):
+        raise ValueError(f"Invalid Salesforce timestamp '{timestamp}'. Expected format: YYYY-MM-DDTHH:MM:SS[.sss]Z")
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError as e:
+        raise ValueError(f"Invalid Salesforce timestamp '{timestamp}': {e}")
+    return _to_sf_iso(parsed)
+
+def _validate_extra_fields(extra_fields):
+    """
+    Checks the extra_fields argument of the ContentVersion sync and returns it as a tuple.
+    The names are interpolated into the SOQL select list, so a bare string (which would otherwise be
+    split into single characters) and anything that is not a field API name are rejected with a
+    ValueError before any Bulk API job is created.
+    """
+    if isinstance(extra_fields, str):
+        raise ValueError(f"extra_fields must be a list of field names, not the string '{extra_fields}'")
+    extra_fields = tuple(extra_fields)
+    for field in extra_fields:
+        if not isinstance(field, str) or not _SF_FIELD_NAME_RE.fullmatch(field):
+            raise ValueError(f"Invalid Salesforce field name in extra_fields: {field!r}")
+    return extra_fields
+
+class _KeepAliveHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connections enable TCP keep-alive on top of urllib3's defaults (TCP_NODELAY),
+    so pooled connections left idle between result sets are not silently dropped by middleboxes.
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        super().init_poolmanager(*args, **kwargs)
+
+def _create_salesforce_http_session(session_id, pool_size):
+    """
+    Creates a requests.Session for downloading Salesforce file content.
+    The session carries the Bearer token and keeps keep-alive connections to the Salesforce content
+    host, so each download does not pay a new TCP + TLS handshake. Up to pool_size files are downloaded
+    at once and each large file uses up to LARGE_FILE_PARALLEL_PARTS connections, so the pool is sized
+    for both; a smaller pool would close and reopen connections under load.
+    Transient errors (throttling, 5xx) are retried with backoff.
+    The session is shared by the download worker threads and must be closed by the caller.
+    """
+    # Retry-After is honoured for 429/503, so Salesforce throttling backs off as long as it asks to.
+    retry = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = _KeepAliveHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size * LARGE_FILE_PARALLEL_PARTS,
+                                    max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.headers['Authorization'] = f'Bearer {session_id}'
+    return session
+
+def _ordered_bounded_map(executor, fn, iterable, max_in_flight):
+    """
+    Submits fn(item) to the executor for every item in iterable and yields the results in input order.
+    At most max_in_flight calls are outstanding at any time, so a large iterable is never queued up front.
+    """
+    in_flight = deque()
+    for item in iterable:
+        in_flight.append(executor.submit(fn, item))
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+_PREFETCH_DONE = object()
+
+def _prefetch_in_background(iterable, max_buffered):
+    """
+    Iterates over iterable on a background thread and yields its items, keeping up to
+    max_buffered items fetched ahead of the consumer. Exceptions raised by the iterable are
+    re-raised in the consumer. If the consumer stops early, the background thread is told to stop.
+    """
+    buffered = queue.Queue(maxsize=max_buffered)
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                buffered.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+            _put((_PREFETCH_DONE, None))
+        except BaseException as e:
+            _put((_PREFETCH_DONE, e))
+
+    producer = threading.Thread(target=_produce, name='prefetch', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = buffered.get()
+            if item is _PREFETCH_DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+# Session-scoped staging table for the ContentVersion batch update. Rows are bulk-inserted with
+# fast_executemany (one parameter array instead of one parameter per value, so the batch size is
+# not bound by SQL Server's 2100-parameter limit) and then applied with a single UPDATE ... JOIN.
+_CV_STAGING_TABLE_SQL = """
+IF OBJECT_ID('tempdb..#StagingContentVersion') IS NULL
+    CREATE TABLE #StagingContentVersion (
+        AzureBlobUrl NVARCHAR(1000) NULL,
+        ContentDocumentId NVARCHAR(18) NOT NULL
+    );
+"""
+
+def _execute_db_batch(cursor, cnxn, batch_data, sync_state=None):
     """
     Executes a batch update for Azure SQL Database (ContentVersion table).
-    batch_data is a list of tuples: [(azure_blob_url, content_document_id, system_modstamp, content_version_id), ...]
+    batch_data is a list of tuples: [(azure_blob_url, content_document_id), ...]
+    The rows are staged in #StagingContentVersion and applied with one UPDATE ... JOIN.
+    sync_state, if given, is a (state_name, last_record_id, last_system_modstamp) tuple that is
+    MERGEd into SyncState in the same transaction, so the checkpoint is committed with the batch.
+    The UPDATE, the staging cleanup and the SyncState MERGE go to the server as one statement batch.
     Returns the number of rows affected or -1 on failure.
     """
     if not batch_data:
         return 0 
 
-    values_placeholders = ', '.join(['(?, ?)' for _ in batch_data]) 
-    
-    flat_params = []
-    for url, doc_id, _, _ in batch_data: 
-        flat_params.append(url)
-        flat_params.append(doc_id)
-
-    update_sql = f"""
+    # NOCOUNT keeps the intermediate statements from returning row counts, so the only
+    # result is the UPDATE's row count selected at the end.
+    apply_sql = """
+    SET NOCOUNT ON;
     UPDATE T
-    SET T.AzureBlobUrl = V.AzureBlobUrl
+    SET T.AzureBlobUrl = S.AzureBlobUrl
     FROM [dbo].[ContentVersion] AS T
-    JOIN (VALUES {values_placeholders}) AS V(AzureBlobUrl, ContentDocumentId)
-        ON T.ContentDocumentId = V.ContentDocumentId;
+    JOIN #StagingContentVersion AS S
+        ON T.ContentDocumentId = S.ContentDocumentId;
+    DECLARE @RowsAffected INT = @@ROWCOUNT;
+    TRUNCATE TABLE #StagingContentVersion;
+    """
+    if sync_state:
+        apply_sql += _SYNC_STATE_MERGE_SQL
+    apply_sql += """
+    SET NOCOUNT OFF;
+    SELECT @RowsAffected;
     """
     
     try:
-        cursor.execute(update_sql, *flat_params) 
+        # The temp table lives for the whole connection; creating it is a no-op after the first batch.
+        cursor.execute(_CV_STAGING_TABLE_SQL)
+        cursor.executemany(
+            "INSERT INTO #StagingContentVersion (AzureBlobUrl, ContentDocumentId) VALUES (?, ?)",
+            batch_data
+        )
+        cursor.execute(apply_sql, *(sync_state or ()))
+        rows_affected = cursor.fetchone()[0]
         cnxn.commit()
-        return cursor.rowcount 
+        if sync_state:
+            logger.info("SyncState updated for '%s' to Record ID: %s, Modstamp: %s", *sync_state)
+        return rows_affected 
     except pyodbc.Error as sql_err:
         cnxn.rollback()
-        print(f"    ERROR executing batch SQL DB update for ContentVersion: {sql_err}")
+        logger.error("Error executing batch SQL DB update for ContentVersion: %s", sql_err)
         return -1 
 
-def _execute_cdl_db_batch(cursor, cnxn, batch_data):
+def _sf_timestamp_from_ms(modstamp_ms):
+    """
+    Formats a SystemModstamp given in epoch milliseconds (as returned by the Bulk API) as a
+    Salesforce dateTime string, e.g. '2024-01-01T00:00:00.000Z', as stored in SyncState.
+    """
+    return _to_sf_iso(datetime.fromtimestamp(modstamp_ms / 1000, tz=timezone.utc))
+
+# Session-scoped staging table for the ContentDocumentLink batch MERGE, filled with fast_executemany
+# like #StagingContentVersion so the batch size is not bound by the 2100-parameter limit.
+_CDL_STAGING_TABLE_SQL = """
+IF OBJECT_ID('tempdb..#StagingContentDocumentLink') IS NULL
+    CREATE TABLE #StagingContentDocumentLink (
+        Id NVARCHAR(18) NOT NULL,
+        LinkedEntityId NVARCHAR(18) NULL,
+        ContentDocumentId NVARCHAR(18) NULL,
+        IsDeleted BIT NULL,
+        SystemModstamp DATETIME2(7) NULL,
+        ShareType NVARCHAR(40) NULL,
+        Visibility NVARCHAR(40) NULL
+    );
+"""
+
+def _execute_cdl_db_batch(cursor, cnxn, batch_data, sync_state=None):
     """
     Executes a batch MERGE operation for Azure SQL Database (ContentDocumentLink table).
     batch_data is a list of tuples: [(Id, LinkedEntityId, ContentDocumentId, IsDeleted, SystemModstamp, ShareType, Visibility), ...]
+    The rows are staged in #StagingContentDocumentLink and applied with one MERGE, so the statement
+    text (and its cached plan) is the same for every batch size.
+    sync_state, if given, is a (state_name, last_record_id, last_system_modstamp) tuple that is
+    MERGEd into SyncState in the same statement batch and transaction, as in _execute_db_batch.
     Returns the number of rows affected or -1 on failure.
     """
     if not batch_data:
         return 0
 
-    # Each tuple in batch_data has 7 elements
-    values_placeholders = ', '.join(['(?, ?, ?, ?, ?, ?, ?)' for _ in batch_data])
-
-    flat_params = []
-    for item in batch_data:
-        # Extend with each element of the tuple
-        flat_params.extend(item)
-
-    merge_sql = f"""
+    # NOCOUNT keeps the intermediate statements from returning row counts, so the only
+    # result is the MERGE's row count selected at the end.
+    merge_sql = """
+    SET NOCOUNT ON;
     MERGE [dbo].[ContentDocumentLink] AS T
-    USING (VALUES {values_placeholders}) AS S
-        (Id, LinkedEntityId, ContentDocumentId, IsDeleted, SystemModstamp, ShareType, Visibility)
+    USING #StagingContentDocumentLink AS S
     ON T.Id = S.Id
     WHEN MATCHED AND T.SystemModstamp < S.SystemModstamp THEN -- Only update if source is newer
         UPDATE SET
@@ -79,46 +492,129 @@ def _execute_cdl_db_batch(cursor, cnxn, batch_data):
     WHEN NOT MATCHED THEN
         INSERT (Id, LinkedEntityId, ContentDocumentId, IsDeleted, SystemModstamp, ShareType, Visibility)
         VALUES (S.Id, S.LinkedEntityId, S.ContentDocumentId, S.IsDeleted, S.SystemModstamp, S.ShareType, S.Visibility);
+    DECLARE @RowsAffected INT = @@ROWCOUNT;
+    TRUNCATE TABLE #StagingContentDocumentLink;
+    """
+    if sync_state:
+        merge_sql += _SYNC_STATE_MERGE_SQL
+    merge_sql += """
+    SET NOCOUNT OFF;
+    SELECT @RowsAffected;
     """
     
     try:
-        cursor.execute(merge_sql, *flat_params)
+        # The temp table lives for the whole connection; creating it is a no-op after the first batch.
+        cursor.execute(_CDL_STAGING_TABLE_SQL)
+        cursor.executemany(
+            "INSERT INTO #StagingContentDocumentLink "
+            "(Id, LinkedEntityId, ContentDocumentId, IsDeleted, SystemModstamp, ShareType, Visibility) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            batch_data
+        )
+        cursor.execute(merge_sql, *(sync_state or ()))
+        rows_affected = cursor.fetchone()[0]
         cnxn.commit()
-        return cursor.rowcount
+        if sync_state:
+            logger.info("SyncState updated for '%s' to Record ID: %s, Modstamp: %s", *sync_state)
+        return rows_affected
     except pyodbc.Error as sql_err:
         cnxn.rollback()
-        print(f"    ERROR executing batch SQL DB MERGE for ContentDocumentLink: {sql_err}")
+        logger.error("Error executing batch SQL DB MERGE for ContentDocumentLink: %s", sql_err)
         return -1
 
-def _update_sync_state(cursor, cnxn, state_name, last_record_id, last_system_modstamp):
+_SYNC_STATE_MERGE_SQL = """
+MERGE [dbo].[SyncState] AS T
+USING (SELECT ? AS StateName, ? AS LastRecordId, ? AS LastSystemModstamp) AS S
+ON T.StateName = S.StateName
+WHEN MATCHED THEN
+    UPDATE SET
+        T.LastRecordId = S.LastRecordId,
+        T.LastSystemModstamp = S.LastSystemModstamp,
+        T.LastUpdatedDateTime = SYSDATETIMEOFFSET()
+WHEN NOT MATCHED THEN
+    INSERT (StateName, LastRecordId, LastSystemModstamp)
+    VALUES (S.StateName, S.LastRecordId, S.LastSystemModstamp);
+"""
+
+class _SqlBatch:
     """
-    Updates the SyncState table with the latest processed record information.
-    Uses MERGE for an UPSERT operation.
-    last_record_id is now a generic placeholder for the ID of any Salesforce object.
-    last_system_modstamp should be in Salesforce's Besançon-MM-DDTHH:MM:SS.sssZ format.
+    Rows waiting for the next batch write of one sync, the records they came from (so a flush only
+    updates those) and the newest SystemModstamp (epoch ms) among them with its record Id, tracked as
+    rows are added and committed as the batch's sync state checkpoint.
+    execute_batch is _execute_db_batch or _execute_cdl_db_batch; object_name, operation and
+    state_name name the batch in log messages and in SyncState.
     """
-    sync_state_sql = """
-    MERGE [dbo].[SyncState] AS T
-    USING (SELECT ? AS StateName, ? AS LastRecordId, ? AS LastSystemModstamp) AS S
-    ON T.StateName = S.StateName
-    WHEN MATCHED THEN
-        UPDATE SET
-            T.LastRecordId = S.LastRecordId,
-            T.LastSystemModstamp = S.LastSystemModstamp,
-            T.LastUpdatedDateTime = SYSDATETIMEOFFSET()
-    WHEN NOT MATCHED THEN
-        INSERT (StateName, LastRecordId, LastSystemModstamp)
-        VALUES (S.StateName, S.LastRecordId, S.LastSystemModstamp);
+    def __init__(self, execute_batch, object_name, operation, state_name):
+        self.execute_batch = execute_batch
+        self.object_name = object_name
+        self.operation = operation
+        self.state_name = state_name
+        self.rows = []
+        self.pending_records = []
+        self.max_modstamp_ms = None
+        self.max_record_id = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, row, record, modstamp_ms, record_id):
+        """
+        Adds row for record. modstamp_ms is None if the record's SystemModstamp could not be parsed;
+        the row is still written but does not count for the checkpoint.
+        """
+        self.rows.append(row)
+        self.pending_records.append(record)
+        if modstamp_ms is not None and (self.max_modstamp_ms is None or modstamp_ms > self.max_modstamp_ms):
+            self.max_modstamp_ms = modstamp_ms
+            self.max_record_id = record_id
+
+    def clear(self):
+        self.rows.clear()
+        self.pending_records.clear()
+        self.max_modstamp_ms = None
+        self.max_record_id = None
+
+def _flush_batch(cursor, cnxn, batch, final=False, error_records=None):
     """
-    try:
-        cursor.execute(sync_state_sql, state_name, last_record_id, last_system_modstamp)
-        cnxn.commit()
-        print(f"    SyncState updated for '{state_name}' to Record ID: {last_record_id}, Modstamp: {last_system_modstamp}")
-        return True
-    except pyodbc.Error as sql_err:
-        cnxn.rollback()
-        print(f"    ERROR updating SyncState for '{state_name}': {sql_err}")
-        return False
+    Writes the rows of batch (a _SqlBatch) with its execute_batch, records the outcome on each of its
+    pending records and empties it. If the write fails, the records are also appended to
+    error_records when it is given.
+    The sync state is only advanced if a valid max timestamp was found in the batch;
+    it is committed together with the batch.
+    Returns the number of rows affected, or 0 if the batch was empty or its write failed.
+    """
+    if not batch.rows:
+        return 0
+    logger.info("Executing %s%s batch %s for %s records...",
+                'final ' if final else '', batch.object_name, batch.operation, len(batch.rows))
+
+    last_modstamp_sf = None
+    sync_state = None
+    if batch.max_modstamp_ms is not None:
+        last_modstamp_sf = _sf_timestamp_from_ms(batch.max_modstamp_ms)
+        sync_state = (batch.state_name, batch.max_record_id, last_modstamp_sf)
+    rows_affected = batch.execute_batch(cursor, cnxn, batch.rows, sync_state)
+
+    suffix = ' - Final' if final else ''
+    checkpointed_modstamp = None
+    if rows_affected < 0:
+        status = f'Failed (Batched{suffix})'
+        if error_records is not None:
+            error_records.extend(batch.pending_records)
+    elif sync_state:
+        status = f'Success (Batched{suffix})'
+        checkpointed_modstamp = last_modstamp_sf
+    elif final:
+        logger.warning("No valid SystemModstamp found in final %s batch for sync state update.", batch.object_name)
+        status = 'Skipped (No valid timestamp in final batch)'
+    else:
+        logger.warning("No valid SystemModstamp found in batch for %s sync state update.", batch.object_name)
+        status = 'Skipped (No valid timestamp in batch)'
+    for r in batch.pending_records:
+        r['SqlUpdateStatus'] = status
+        r['LastSystemModstampInBatch'] = checkpointed_modstamp
+    batch.clear()
+    return max(rows_affected, 0)
 
 def _get_last_sync_timestamp_from_db(cursor, state_name):
     """
@@ -139,27 +635,271 @@ def _get_last_sync_timestamp_from_db(cursor, state_name):
         cursor.execute(select_sql, state_name)
         result = cursor.fetchone()
         if result and result[0]:
-            dt_object = result[0]
-            # Convert datetime object (which is now guaranteed to be UTC from the SQL query)
+            # Convert the datetime (guaranteed to be UTC by the SQL query, and naive from CAST AS DATETIME)
             # back to Salesforce's expected string format (ISO 8601 with 'Z' for UTC)
-            # Ensure proper ISO format for timezone-aware or naive UTC datetime
-            if dt_object.tzinfo is not None and dt_object.tzinfo.utcoffset(dt_object) == timedelta(0):
-                    # If it's a timezone-aware UTC datetime (e.g., from datetime.fromisoformat with +00:00)
-                return dt_object.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
-            else:
-                # If it's a naive datetime (typical for CAST AS DATETIME), assume it's UTC and append 'Z'
-                return dt_object.isoformat(timespec='milliseconds') + 'Z'
+            return _to_sf_iso(result[0])
         else:
-            print(f"    No existing sync state found for '{state_name}' in SyncState table.")
+            logger.info("No existing sync state found for '%s' in SyncState table.", state_name)
             return None
     except pyodbc.Error as sql_err:
-        print(f"    ERROR retrieving last sync timestamp for '{state_name}': {sql_err}")
+        logger.error("Error retrieving last sync timestamp for '%s': %s", state_name, sql_err)
+        return None
+
+def _iter_version_data(http_session, url, chunk_size=DOWNLOAD_CHUNK_SIZE, max_attempts=3):
+    """
+    Yields the file content behind a Salesforce VersionDataUrl in chunks of up to chunk_size bytes.
+    If the connection drops mid-transfer, the download is resumed with an HTTP Range request from the
+    last received byte instead of starting over, up to max_attempts attempts in total.
+    If the server ignores the Range header (200 instead of 206), the bytes already yielded are
+    skipped from the new response, so callers always see one contiguous stream.
+    """
+    received = 0
+    attempt = 1
+    use_range = True
+    while True:
+        headers = {'Range': f'bytes={received}-'} if received and use_range else None
+        try:
+            # The with block hands the connection back to the session pool even if the read fails.
+            with http_session.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+                if headers and response.status_code == 416:
+                    return # The connection dropped after the last byte; nothing is left to fetch
+                response.raise_for_status()
+                # Range offsets refer to the encoded bytes, so only resume by range for unencoded content
+                if response.headers.get('Content-Encoding'):
+                    use_range = False
+                to_skip = received if received and response.status_code != 206 else 0
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if to_skip:
+                        if len(chunk) <= to_skip:
+                            to_skip -= len(chunk)
+                            continue
+                        chunk = chunk[to_skip:]
+                        to_skip = 0
+                    received += len(chunk)
+                    yield chunk
+            return
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            if attempt >= max_attempts:
+                raise
+            attempt += 1
+            logger.warning("Download interrupted after %s bytes (%s). Resuming (attempt %s/%s)...", received, e, attempt, max_attempts)
+
+class _RangeNotSupportedError(Exception):
+    """Raised when a ranged download is answered with the full file instead of 206 Partial Content."""
+
+def _fetch_version_data_range(http_session, url, start, end, max_attempts=3):
+    """
+    Downloads bytes start..end (inclusive) of the file behind a Salesforce VersionDataUrl and returns
+    them as a bytearray, which stage_block sends as is (converting it to bytes would copy the part).
+    A dropped connection is resumed from the last received byte, up to max_attempts attempts in total.
+    Raises _RangeNotSupportedError if the server does not honour the Range header.
+    """
+    buffer = bytearray()
+    attempt = 1
+    expected_length = end - start + 1
+    while True:
+        headers = {'Range': f'bytes={start + len(buffer)}-{end}'}
+        try:
+            with http_session.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                if response.status_code != 206 or response.headers.get('Content-Encoding'):
+                    raise _RangeNotSupportedError(f"Range request answered with HTTP {response.status_code}")
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    buffer += chunk
+            if len(buffer) != expected_length:
+                raise ValueError(f"Expected {expected_length} bytes for range {start}-{end}, got {len(buffer)}")
+            return buffer
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            if attempt >= max_attempts:
+                raise
+            attempt += 1
+            logger.warning("Download of range %s-%s interrupted after %s bytes (%s). Resuming (attempt %s/%s)...", start, end, len(buffer), e, attempt, max_attempts)
+
+def _transfer_in_parallel_parts(http_session, url, blob_client, content_size, content_md5):
+    """
+    Copies a large file from Salesforce to a block blob in LARGE_FILE_PART_SIZE parts.
+    Parts are downloaded with ranged GETs on up to LARGE_FILE_PARALLEL_PARTS threads and each part
+    is staged as one block; the blob only appears (atomically) once the block list is committed.
+    Returns True on success, or False (with nothing committed) if Salesforce does not honour
+    ranged requests, in which case the caller should fall back to a single-stream transfer.
+    """
+    part_ranges = [(start, min(start + LARGE_FILE_PART_SIZE, content_size) - 1)
+                   for start in range(0, content_size, LARGE_FILE_PART_SIZE)]
+    # Block IDs must all have the same length within a blob
+    block_ids = [base64.b64encode(f"{index:08d}".encode()).decode() for index in range(len(part_ranges))]
+
+    def stage_part(index):
+        start, end = part_ranges[index]
+        blob_client.stage_block(block_ids[index], _fetch_version_data_range(http_session, url, start, end))
+
+    try:
+        with ThreadPoolExecutor(max_workers=LARGE_FILE_PARALLEL_PARTS) as part_executor:
+            # Parts are submitted in a bounded window, so the first failure is re-raised with at
+            # most LARGE_FILE_PARALLEL_PARTS parts in flight instead of the rest of the file queued
+            for _ in _ordered_bounded_map(part_executor, stage_part, range(len(part_ranges)),
+                                          LARGE_FILE_PARALLEL_PARTS):
+                pass
+    except _RangeNotSupportedError as e:
+        logger.warning("%s. Falling back to a single-stream download.", e)
+        return False
+
+    blob_client.commit_block_list([BlobBlock(block_id=block_id) for block_id in block_ids],
+                                  content_settings=ContentSettings(content_md5=content_md5))
+    return True
+
+def _md5_from_checksum(checksum):
+    """
+    Converts a Salesforce ContentVersion Checksum (hex MD5) to the bytearray form used in blob content settings.
+    Returns None if the checksum is missing or not valid hex.
+    """
+    if not checksum:
+        return None
+    try:
+        return bytearray.fromhex(checksum)
+    except (TypeError, ValueError):
         return None
 
+def _blob_matches_content_version(blob_client, content_size, content_md5):
+    """
+    Checks whether the blob already holds this ContentVersion's file, so it does not need to be
+    downloaded and uploaded again. Costs one HEAD request instead of a full file transfer.
+    The blob must exist with the same size, and if both sides have an MD5 the hashes must match too
+    (blob names contain the ContentVersion Id, whose file content never changes).
+    """
+    if content_size is None:
+        return False
+    try:
+        properties = blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return False
+    if properties.size != int(content_size):
+        return False
+    existing_md5 = properties.content_settings.content_md5
+    if content_md5 is not None and existing_md5:
+        return bytes(existing_md5) == bytes(content_md5)
+    return True
+
+def _content_version_blob_name(content_version_id, title, file_extension):
+    """
+    Returns the blob name for a ContentVersion: '<Id>_<title>.<extension>' with unsafe characters
+    removed from the title (falling back to the Id), '.bin' if there is no extension, and spaces
+    replaced by underscores. The title is cut to at most MAX_BLOB_TITLE_URL_LENGTH characters once
+    percent-encoded, so that long non-ASCII titles still fit the AzureBlobUrl column.
+    """
+    safe_title = _UNSAFE_FILENAME_CHARS_RE.sub('', title or content_version_id).strip().replace(' ', '_')
+    encoded_length = 0
+    for index, char in enumerate(safe_title):
+        encoded_length += len(quote(char, safe='~/'))
+        if encoded_length > MAX_BLOB_TITLE_URL_LENGTH:
+            safe_title = safe_title[:index]
+            break
+    return f"{content_version_id}_{safe_title}.{file_extension or 'bin'}".replace(' ', '_')
+
+def _process_content_version_record(record, http_session, container_client, blob_url_prefix, large_file_slots):
+    """
+    Downloads the file of a single ContentVersion record from Salesforce and uploads it to Azure Blob Storage.
+    blob_url_prefix is the container URL ending in '/', computed once per sync; the record's
+    AzureBlobUrl is blob_url_prefix + blob name.
+    large_file_slots is a semaphore shared by the sync's workers that bounds how many large files
+    (each holding up to LARGE_FILE_PARALLEL_PARTS parts in memory) are transferred at once.
+    Runs on a worker thread and only touches the given record, so it needs no locking.
+    The transfer is skipped if the blob already holds the file (see _blob_matches_content_version).
+    Sets AzureBlobUrl, DownloadError and SqlUpdateStatus on the record.
+    SqlUpdateStatus is 'Pending Batch Update' if the file is in Azure Blob Storage and the record
+    should be added to the SQL DB update batch.
+    The transfer-only fields (_CONTENT_VERSION_TRANSFER_ONLY_FIELDS) are removed from the record
+    before it is returned.
+    Returns a tuple (record, uploaded) where uploaded is True if the file was transferred.
+    """
+    version_data_url = record.get('VersionDataUrl')
+    file_extension = record.get('FileExtension')
+    title = record.get('Title')
+    content_version_id = record.get('Id')
+    content_document_id = record.get('ContentDocumentId')
+    system_modstamp = record.get('SystemModstamp') # This is the incoming long millisecond timestamp
+    uploaded = False
+
+    record['AzureBlobUrl'] = None
+    record['DownloadError'] = None
+    record['SqlUpdateStatus'] = 'Skipped'
+    record['LastSystemModstampInBatch'] = None
+
+    if version_data_url and content_document_id and system_modstamp is not None: # Check for None explicitly
+        full_download_url = version_data_url
+
+        blob_name = _content_version_blob_name(content_version_id, title, file_extension)
+
+        # Quoted the same way the SDK quotes blob URLs; names built by _content_version_blob_name are
+        # already URL-safe for ASCII titles, so only non-ASCII characters are percent-encoded.
+        azure_blob_url = blob_url_prefix + quote(blob_name, safe='~/')
+
+        if len(azure_blob_url) > AZURE_BLOB_URL_MAX_LENGTH:
+            # Would not fit the SQL column and fail the whole batch, so only this record is skipped
+            logger.error("Blob URL for %s (ID: %s) is %s characters, over the %s the AzureBlobUrl column holds; skipping.",
+                         blob_name, content_version_id, len(azure_blob_url), AZURE_BLOB_URL_MAX_LENGTH)
+            record['DownloadError'] = f"Skipped: AzureBlobUrl longer than {AZURE_BLOB_URL_MAX_LENGTH} characters."
+            record['SqlUpdateStatus'] = 'Not Attempted (Blob URL Too Long)'
+        else:
+            try:
+                blob_client = container_client.get_blob_client(blob_name)
+                content_md5 = _md5_from_checksum(record.get('Checksum'))
+
+                content_size = record.get('ContentSize')
+
+                if _blob_matches_content_version(blob_client, content_size, content_md5):
+                    logger.debug("Unchanged: %s (ID: %s) already in Azure Blob, skipping transfer", blob_name, content_version_id)
+                else:
+                    if content_size is not None and int(content_size) >= LARGE_FILE_THRESHOLD:
+                        with large_file_slots:
+                            uploaded = _transfer_in_parallel_parts(http_session, full_download_url, blob_client,
+                                                                   int(content_size), content_md5)
+
+                    if not uploaded:
+                        # --- Stream File from Salesforce to Azure Blob ---
+                        # The download chunks are handed straight to the SDK instead of being collected in a
+                        # buffer first; with the length known it can choose between a single PUT and blocks.
+                        # Blocks are uploaded one at a time, so each worker holds at most one
+                        # LARGE_FILE_PART_SIZE block; parallelism comes from the worker pool.
+                        # Storing the Salesforce MD5 on the blob lets later syncs detect that it is unchanged.
+                        blob_client.upload_blob(_iter_version_data(http_session, full_download_url),
+                                                length=int(content_size) if content_size is not None else None,
+                                                overwrite=True,
+                                                max_concurrency=1,
+                                                content_settings=ContentSettings(content_md5=content_md5))
+                        uploaded = True
+                    logger.debug("Uploaded: %s (ID: %s) to %s", blob_name, content_version_id, azure_blob_url)
+
+                record['AzureBlobUrl'] = azure_blob_url
+                record['DownloadError'] = 'None'
+                record['SqlUpdateStatus'] = 'Pending Batch Update'
+
+            except requests.exceptions.RequestException as req_e:
+                logger.error("Error downloading/uploading %s (ID: %s): %s", blob_name, content_version_id, req_e)
+                record['DownloadError'] = str(req_e)
+                record['SqlUpdateStatus'] = 'Not Attempted (Download Failed)'
+            except Exception as e:
+                logger.exception("Unexpected error for %s (ID: %s): %s", blob_name, content_version_id, e)
+                record['DownloadError'] = str(e)
+                record['SqlUpdateStatus'] = 'Not Attempted (Processing Failed)'
+    else:
+        reason = ""
+        if not version_data_url: reason += "No VersionDataUrl. "
+        if not content_document_id: reason += "No ContentDocumentId. "
+        if system_modstamp is None: reason += "No SystemModstamp. "
+        record['DownloadError'] = f"Skipped: {reason.strip()}"
+        record['SqlUpdateStatus'] = 'Not Attempted (Missing Data)'
+
+    for field in _CONTENT_VERSION_TRANSFER_ONLY_FIELDS:
+        record.pop(field, None)
+
+    return record, uploaded
+
 
 def download_content_versions_and_files_to_azure_blob_and_sql_batched(
     username, password, security_token, initial_last_sync_timestamp, 
-    sandbox=False
+    sandbox=False, extra_fields=None
 ):
     """
     Downloads ContentVersion objects from Salesforce using Bulk API 2.0,
@@ -170,7 +910,10 @@ def download_content_versions_and_files_to_azure_blob_and_sql_batched(
     - SF_USERNAME, SF_PASSWORD, SF_SECURITY_TOKEN (for Salesforce)
     - AZURE_STORAGE_ACCOUNT_NAME, AZURE_STORAGE_CONTAINER_NAME, AZURE_STORAGE_ACCOUNT_KEY (for Azure Blob)
     - AZURE_SQL_CONNECTION_STRING (for Azure SQL DB)
-    - AZURE_DB_BATCH_SIZE (optional, defaults to 5 if not set or invalid)
+    - AZURE_DB_BATCH_SIZE (optional, rows per staged bulk update, defaults to 1000 if not set or invalid)
+    - SF_SESSION_MAX_AGE_SECONDS (optional, how long a Salesforce login is reused by later syncs, defaults to 28800)
+    - SF_DOWNLOAD_CONCURRENCY (optional, number of files downloaded/uploaded in parallel, defaults to 16)
+    - SF_MAX_PARALLEL_LARGE_FILES (optional, how many of those may be large files transferred in parts, defaults to 2)
 
     Args:
         username (str): Salesforce username.
@@ -180,6 +923,11 @@ def download_content_versions_and_files_to_azure_blob_and_sql_batched(
                                             to use if no state is found in the database.
         sandbox (bool, optional): Set to True if connecting to a sandbox environment.
                                   Defaults to False (production).
+        extra_fields (list, optional): Additional ContentVersion fields to select on top of
+                                       CONTENT_VERSION_FIELDS (e.g. ['Description', 'OwnerId']).
+                                       Names must be field API names (relationship paths allowed);
+                                       anything else is rejected before connecting to Salesforce.
+                                       Defaults to None (only the fields the sync needs).
 
     Returns:
         list: A list of dictionaries containing the processed records
@@ -189,26 +937,27 @@ def download_content_versions_and_files_to_azure_blob_and_sql_batched(
     sf = None
     container_client = None
     cnxn = None
+    http_session = None
 
     try:
+        # --- Validate and normalise the fallback timestamp before connecting to anything ---
+        initial_last_sync_timestamp = _canonical_sf_timestamp(initial_last_sync_timestamp)
+        if extra_fields:
+            extra_fields = _validate_extra_fields(extra_fields)
+
         # --- Read Batch Size from Environment Variable ---
-        db_batch_size_str = os.environ.get('AZURE_DB_BATCH_SIZE', '50') 
-        try:
-            db_batch_size = int(db_batch_size_str)
-            if db_batch_size <= 0:
-                raise ValueError("Batch size must be a positive integer.")
-        except ValueError as e:
-            print(f"Warning: Invalid AZURE_DB_BATCH_SIZE environment variable '{db_batch_size_str}'. Defaulting to 5. Error: {e}")
-            db_batch_size = 5
+        # Batches are staged with fast_executemany, so the size is not bound by the SQL Server
+        # parameter limit; larger batches mean fewer round-trips and commits per synced file.
+        db_batch_size = _get_positive_int_env('AZURE_DB_BATCH_SIZE', 1000)
+
+        # --- Read Download Concurrency from Environment Variable ---
+        download_concurrency = _get_positive_int_env('SF_DOWNLOAD_CONCURRENCY', 16)
+        # Each large file holds up to LARGE_FILE_PARALLEL_PARTS parts of LARGE_FILE_PART_SIZE in memory
+        max_parallel_large_files = _get_positive_int_env('SF_MAX_PARALLEL_LARGE_FILES', 2)
 
         # --- Salesforce Connection ---
-        sf = Salesforce(
-            username=username,
-            password=password,
-            security_token=security_token,
-            domain='test' if sandbox else 'login'
-        )
-        print(f"Successfully connected to Salesforce. API version: {sf.api_version}")
+        sf = _get_salesforce_client(username, password, security_token, sandbox)
+        logger.info("Successfully connected to Salesforce. API version: %s", sf.api_version)
 
         # --- Azure Blob Storage Setup ---
         azure_storage_account_name = os.environ.get('AZURE_STORAGE_ACCOUNT_NAME')
@@ -225,23 +974,21 @@ def download_content_versions_and_files_to_azure_blob_and_sql_batched(
                 "Either AZURE_STORAGE_ACCOUNT_KEY or AZURE_STORAGE_CONNECTION_STRING (for Blob) must be set."
             )
 
-        print("Initializing Azure Blob Storage client...")
-        if azure_storage_connection_string_blob:
-            blob_service_client = BlobServiceClient.from_connection_string(azure_storage_connection_string_blob)
-        else:
-            account_url = f"https://{azure_storage_account_name}.blob.core.windows.net"
-            blob_service_client = BlobServiceClient(account_url=account_url, credential=azure_storage_account_key)
-
-        container_client = blob_service_client.get_container_client(azure_storage_container_name)
-        try:
-            container_client.get_container_properties()
-            print(f"Connected to existing Azure container: {azure_storage_container_name}")
-        except ResourceNotFoundError:
-            print(f"Container '{azure_storage_container_name}' not found. Creating it now...")
-            container_client.create_container()
-            print(f"Container '{azure_storage_container_name}' created.")
-        except ClientAuthenticationError as auth_err:
-            raise ValueError(f"Azure authentication error for Blob Storage: {auth_err}")
+        logger.info("Initializing Azure Blob Storage client...")
+        container_client = _get_container_client(azure_storage_account_name, azure_storage_container_name,
+                                                 azure_storage_connection_string_blob, azure_storage_account_key)
+        # create_container is idempotent here: an existing container answers 409 (ResourceExistsError),
+        # so one request both checks for and, on the first run, creates the container.
+        container_key = (azure_storage_account_name, azure_storage_container_name)
+        if container_key not in _VERIFIED_CONTAINERS:
+            try:
+                container_client.create_container()
+                logger.info("Container '%s' created.", azure_storage_container_name)
+            except ResourceExistsError:
+                logger.info("Connected to existing Azure container: %s", azure_storage_container_name)
+            except ClientAuthenticationError as auth_err:
+                raise ValueError(f"Azure authentication error for Blob Storage: {auth_err}")
+            _VERIFIED_CONTAINERS.add(container_key)
 
         # --- Azure SQL Database Setup ---
         azure_sql_connection_string = os.environ.get('AZURE_SQL_CONNECTION_STRING')
@@ -251,249 +998,112 @@ def download_content_versions_and_files_to_azure_blob_and_sql_batched(
                 "Environment variable AZURE_SQL_CONNECTION_STRING must be set for Azure SQL Database connection."
             )
         
-        print("Connecting to Azure SQL Database using connection string...")
-        cnxn = pyodbc.connect(azure_sql_connection_string)
+        logger.info("Connecting to Azure SQL Database using connection string...")
+        cnxn = _acquire_sql_connection(azure_sql_connection_string)
         cursor = cnxn.cursor()
-        print("Successfully connected to Azure SQL Database.")
+        cursor.fast_executemany = True # Used by _execute_db_batch to stage each batch in one round-trip
+        logger.info("Successfully connected to Azure SQL Database.")
 
         # --- Determine the actual start timestamp for the SOQL query ---
         db_last_sync_timestamp = _get_last_sync_timestamp_from_db(cursor, 'ContentVersionSync')
         
         soql_start_timestamp = db_last_sync_timestamp if db_last_sync_timestamp else initial_last_sync_timestamp
-        print(f"Starting Salesforce ContentVersion query from SystemModstamp: {soql_start_timestamp}")
+        logger.info("Starting Salesforce ContentVersion query from SystemModstamp: %s", soql_start_timestamp)
 
 
         # --- Salesforce SOQL Query ---
-        soql_query = (
-            f"SELECT Id, ContentDocumentId, IsLatest, ContentUrl, ContentBodyId, "
-            f"VersionNumber, Title, Description, ReasonForChange, SharingOption, "
-            f"SharingPrivacy, PathOnClient, RatingCount, IsDeleted, ContentModifiedDate, "
-            f"ContentModifiedById, PositiveRatingCount, NegativeRatingCount, FeaturedContentBoost, "
-            f"FeaturedContentDate, OwnerId, CreatedById, CreatedDate, LastModifiedById, "
-            f"LastModifiedDate, SystemModstamp, TagCsv, FileType, PublishStatus, "
-            f"ContentSize, FileExtension, FirstPublishLocationId, Origin, NetworkId, "
-            f"ContentLocation, TextPreview, ExternalDocumentInfo1, ExternalDocumentInfo2, "
-            f"Checksum, IsMajorVersion, IsAssetEnabled, VersionDataUrl "
-            f"FROM ContentVersion WHERE SystemModstamp > {soql_start_timestamp} "
-            f"ORDER BY SystemModstamp ASC" # Added ORDER BY clause
-        )
-        print(f"Executing SOQL query: {soql_query}")
+        select_clause = _CONTENT_VERSION_SELECT
+        if extra_fields:
+            # dict.fromkeys drops duplicates while keeping the field order
+            select_clause = ', '.join(dict.fromkeys(CONTENT_VERSION_FIELDS + extra_fields))
+        soql_query = _CONTENT_VERSION_SOQL_TEMPLATE.format(fields=select_clause, ts=soql_start_timestamp)
+        logger.info("Executing SOQL query: %s", soql_query)
 
         # --- Execute Bulk API Query and Process Records ---
-        job_result = sf.bulk.ContentVersion.query(soql_query)
-
-        session_id = sf.session_id
+        # lazy_operation=True yields one list of records per Bulk API result set as it is fetched,
+        # so file transfers start on the first result set instead of after all of them are downloaded.
+        # The next result set is fetched on a background thread while the current one is transferred.
+        sf, result_sets = _start_bulk_query(sf, 'ContentVersion', soql_query,
+                                            username, password, security_token, sandbox)
+        job_result = chain.from_iterable(_prefetch_in_background(result_sets, 1))
+
+        http_session = _create_salesforce_http_session(sf.session_id, download_concurrency)
         processed_records = []
-        db_update_batch = [] 
+        sql_batch = _SqlBatch(_execute_db_batch, 'ContentVersion', 'update', 'ContentVersionSync')
         
         download_count = 0
+        unchanged_count = 0
         record_count = 0
         sql_batch_update_count = 0
 
-        print(f"Starting file downloads, Azure Blob uploads, and Azure SQL updates (batch size: {db_batch_size})...")
-        for record in job_result:
-            record_count += 1
-            version_data_url = record.get('VersionDataUrl')
-            file_extension = record.get('FileExtension')
-            title = record.get('Title')
-            content_version_id = record.get('Id') 
-            content_document_id = record.get('ContentDocumentId')
-            system_modstamp = record.get('SystemModstamp') # This is the incoming long millisecond timestamp
-
-            record['AzureBlobUrl'] = None
-            record['DownloadError'] = None
-            record['SqlUpdateStatus'] = 'Skipped' 
-            record['LastSystemModstampInBatch'] = None 
-
-            if version_data_url and content_document_id and system_modstamp is not None: # Check for None explicitly
-                full_download_url = version_data_url 
-                
-                safe_title = "".join([c for c in (title or content_version_id) if c.isalnum() or c in (' ', '.', '_', '-')]).strip()
-                blob_name = f"{safe_title}"
-                if file_extension:
-                    blob_name = f"{blob_name}.{file_extension}"
-                else:
-                    blob_name = f"{blob_name}.bin"
-                blob_name = blob_name.replace(' ', '_') 
-                blob_name = f"{content_version_id}_{blob_name}"
+        process_record = partial(
+            _process_content_version_record,
+            http_session=http_session,
+            container_client=container_client,
+            blob_url_prefix=f"https://{azure_storage_account_name}.blob.core.windows.net/{azure_storage_container_name}/",
+            large_file_slots=threading.BoundedSemaphore(max_parallel_large_files)
+        )
+
+        logger.info("Starting file downloads, Azure Blob uploads, and Azure SQL updates (batch size: %s, download concurrency: %s)...", db_batch_size, download_concurrency)
+        with ThreadPoolExecutor(max_workers=download_concurrency) as executor:
+            # Records come back in query order (SystemModstamp ASC), so the sync state
+            # recorded for a batch never gets ahead of a record that is still in flight.
+            for record, uploaded in _ordered_bounded_map(executor, process_record, job_result, download_concurrency * 2):
+                record_count += 1
+                processed_records.append(record)
 
-                azure_blob_url = f"https://{azure_storage_account_name}.blob.core.windows.net/{azure_storage_container_name}/{blob_name}"
+                if record['SqlUpdateStatus'] != 'Pending Batch Update':
+                    continue
+
+                if uploaded:
+                    download_count += 1
+                else:
+                    unchanged_count += 1
 
+                # --- Add to SQL DB Update Batch ---
+                # Only the two bound columns are kept per row; the checkpoint is tracked by sql_batch.
                 try:
-                    # --- Download File ---
-                    headers = {
-                        'Authorization': f'Bearer {session_id}'
-                    }
-                    response = requests.get(full_download_url, headers=headers, stream=True)
-                    response.raise_for_status()
-
-                    file_content_buffer = BytesIO()
-                    for chunk in response.iter_content(chunk_size=8192):
-                        file_content_buffer.write(chunk)
-                    file_content_buffer.seek(0)
-
-                    # --- Upload to Azure Blob ---
-                    blob_client = container_client.get_blob_client(blob_name)
-                    blob_client.upload_blob(file_content_buffer, overwrite=True)
-                    
-                    print(f"    Uploaded: {blob_name} (ID: {content_version_id}) to {azure_blob_url}")
-                    record['AzureBlobUrl'] = azure_blob_url
-                    record['DownloadError'] = 'None' 
-
-                    # --- Add to SQL DB Update Batch ---
-                    # system_modstamp (from record.get) is the millisecond timestamp here
-                    # We store it in db_update_batch as is for now, it's converted to ISO string later
-                    # for the DB update itself.
-                    db_update_batch.append((azure_blob_url, content_document_id, system_modstamp, content_version_id)) 
-                    record['SqlUpdateStatus'] = 'Pending Batch Update'
+                    modstamp_ms = float(record['SystemModstamp'])
+                except (TypeError, ValueError) as e:
+                    # Still updated in SQL, but not used for the sync state checkpoint
+                    logger.warning("Could not parse SystemModstamp '%s' for record %s. Error: %s", record['SystemModstamp'], record['Id'], e)
+                    modstamp_ms = None
+                sql_batch.add((record['AzureBlobUrl'], record['ContentDocumentId']), record, modstamp_ms, record['Id'])
 
-                    # --- Execute Batch Update if size reached ---
-                    if len(db_update_batch) >= db_batch_size:
-                        print(f"    Executing ContentVersion batch update for {len(db_update_batch)} records...")
-                        rows_affected = _execute_db_batch(cursor, cnxn, db_update_batch)
-                        
-                        if rows_affected >= 0: 
-                            sql_batch_update_count += rows_affected
-                            
-                            max_modstamp_in_batch = None
-                            last_record_id_in_batch = None 
-                            
-                            for batch_item in db_update_batch:
-                                current_modstamp_ms = batch_item[2] # This is now the long millisecond timestamp
-                                current_record_id = batch_item[3]
-
-                                # Convert milliseconds since epoch to UTC datetime object
-                                try:
-                                    current_modstamp_dt = datetime.fromtimestamp(float(current_modstamp_ms) / 1000, tz=timezone.utc)
-                                except (TypeError, ValueError) as e:
-                                    print(f"    WARNING: Could not parse SystemModstamp '{current_modstamp_ms}' for record {current_record_id}. Error: {e}")
-                                    continue # Skip this item for timestamp comparison, but still process others in batch
-
-                                if max_modstamp_in_batch is None or current_modstamp_dt > max_modstamp_in_batch:
-                                    max_modstamp_in_batch = current_modstamp_dt
-                                    last_record_id_in_batch = current_record_id
-
-                            # Only update sync state if a valid max timestamp was found in the batch
-                            if max_modstamp_in_batch:
-                                # Convert Python datetime object back to Salesforce's expected string format for DB storage
-                                max_modstamp_sf_format = max_modstamp_in_batch.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
-
-                                _update_sync_state(cursor, cnxn, 'ContentVersionSync', 
-                                                     last_record_id_in_batch, 
-                                                     max_modstamp_sf_format) 
-
-                                for r in processed_records: 
-                                    if r.get('SqlUpdateStatus') == 'Pending Batch Update': 
-                                        r['SqlUpdateStatus'] = 'Success (Batched)'
-                                        r['LastSystemModstampInBatch'] = max_modstamp_sf_format
-                            else:
-                                print(f"    WARNING: No valid SystemModstamp found in batch for ContentVersion sync state update.")
-                                for r in processed_records:
-                                    if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                                        r['SqlUpdateStatus'] = 'Skipped (No valid timestamp in batch)'
-
-                        else: # rows_affected < 0, indicating DB error
-                             for r in processed_records:
-                                 if r.get('SqlUpdateStatus') == 'Pending Batch Update': 
-                                     r['SqlUpdateStatus'] = 'Failed (Batched)' 
-                        db_update_batch = [] 
-
-                except requests.exceptions.RequestException as req_e:
-                    print(f"    ERROR downloading/uploading {blob_name} (ID: {content_version_id}): {req_e}")
-                    record['DownloadError'] = str(req_e)
-                    record['SqlUpdateStatus'] = 'Not Attempted (Download Failed)'
-                except Exception as e:
-                    print(f"    UNEXPECTED ERROR for {blob_name} (ID: {content_version_id}): {e}")
-                    record['DownloadError'] = str(e)
-                    record['SqlUpdateStatus'] = 'Not Attempted (Processing Failed)'
-            else:
-                reason = ""
-                if not version_data_url: reason += "No VersionDataUrl. "
-                if not content_document_id: reason += "No ContentDocumentId. "
-                if system_modstamp is None: reason += "No SystemModstamp. "
-                record['DownloadError'] = f"Skipped: {reason.strip()}"
-                record['SqlUpdateStatus'] = 'Not Attempted (Missing Data)'
-            
-            processed_records.append(record)
+                # --- Execute Batch Update if size reached ---
+                if len(sql_batch) >= db_batch_size:
+                    sql_batch_update_count += _flush_batch(cursor, cnxn, sql_batch)
 
         # --- Execute any remaining batch updates after loop ---
-        if db_update_batch:
-            print(f"    Executing final ContentVersion batch update for {len(db_update_batch)} records...")
-            rows_affected = _execute_db_batch(cursor, cnxn, db_update_batch)
-            
-            if rows_affected >= 0: 
-                sql_batch_update_count += rows_affected
-                
-                max_modstamp_in_batch = None
-                last_record_id_in_batch = None 
-                for batch_item in db_update_batch:
-                    current_modstamp_ms = batch_item[2] # This is now the long millisecond timestamp
-                    current_record_id = batch_item[3]
-
-                    # Convert milliseconds since epoch to UTC datetime object
-                    try:
-                        current_modstamp_dt = datetime.fromtimestamp(float(current_modstamp_ms) / 1000, tz=timezone.utc)
-                    except (TypeError, ValueError) as e:
-                        print(f"    WARNING: Could not parse SystemModstamp '{current_modstamp_ms}' for record {current_record_id}. Error: {e}")
-                        continue # Skip this item for timestamp comparison, but still process others in batch
-
-                    if max_modstamp_in_batch is None or current_modstamp_dt > max_modstamp_in_batch:
-                        max_modstamp_in_batch = current_modstamp_dt
-                        last_record_id_in_batch = current_record_id
-
-                # Only update sync state if a valid max timestamp was found in the batch
-                if max_modstamp_in_batch:
-                    max_modstamp_sf_format = max_modstamp_in_batch.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
-
-                    _update_sync_state(cursor, cnxn, 'ContentVersionSync', 
-                                         last_record_id_in_batch, 
-                                         max_modstamp_sf_format)
-
-                    for r in processed_records: 
-                        if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                            r['SqlUpdateStatus'] = 'Success (Batched - Final)'
-                            r['LastSystemModstampInBatch'] = max_modstamp_sf_format
-                else:
-                    print(f"    WARNING: No valid SystemModstamp found in final ContentVersion batch for sync state update.")
-                    for r in processed_records:
-                        if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                            r['SqlUpdateStatus'] = 'Skipped (No valid timestamp in final batch)'
-
-            else: # rows_affected < 0, indicating DB error
-                for r in processed_records:
-                    if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                        r['SqlUpdateStatus'] = 'Failed (Batched - Final)'
+        sql_batch_update_count += _flush_batch(cursor, cnxn, sql_batch, final=True)
             
         if not processed_records:
-            print(f"No ContentVersion records found since the last sync timestamp ({soql_start_timestamp}), or none processed.")
+            logger.info("No ContentVersion records found since the last sync timestamp (%s), or none processed.", soql_start_timestamp)
             return None
 
-        print(f"Summary for ContentVersion sync:")
-        print(f"Total ContentVersion metadata records processed: {record_count}")
-        print(f"Total files uploaded to Azure Blob: {download_count}")
-        print(f"Total SQL DB records updated via batches: {sql_batch_update_count}")
+        logger.info("Summary for ContentVersion sync:")
+        logger.info("Total ContentVersion metadata records processed: %s", record_count)
+        logger.info("Total files uploaded to Azure Blob: %s", download_count)
+        logger.info("Total files already up to date in Azure Blob (transfer skipped): %s", unchanged_count)
+        logger.info("Total SQL DB records updated via batches: %s", sql_batch_update_count)
 
         return processed_records
 
     except (SalesforceError, ValueError, ClientAuthenticationError, pyodbc.Error) as e:
-        print(f"A critical error occurred during ContentVersion sync: {e}")
+        logger.error("A critical error occurred during ContentVersion sync: %s", e)
+        if isinstance(e, SalesforceError):
+            # The cached session may have expired or been revoked; log in again on the next sync
+            _discard_salesforce_client(sf)
         return None
     except Exception as e:
-        print(f"An unexpected general error occurred during ContentVersion sync: {e}")
+        logger.exception("An unexpected general error occurred during ContentVersion sync: %s", e)
         return None
     finally:
-        if sf and hasattr(sf, 'session') and sf.session:
-            try:
-                sf.close()
-                print("Salesforce session closed.")
-            except Exception as e:
-                print(f"Error closing Salesforce session: {e}")
+        if http_session:
+            http_session.close()
         if cnxn:
-            try:
-                cnxn.close()
-                print("Azure SQL Database connection closed.")
-            except Exception as e:
-                print(f"Error closing Azure SQL Database connection: {e}")
+            _release_sql_connection(azure_sql_connection_string, cnxn)
+            logger.info("Azure SQL Database connection returned to the pool.")
 
 
 def download_content_document_links_to_sql_batched(
@@ -508,7 +1118,8 @@ def download_content_document_links_to_sql_batched(
     Required Environment Variables:
     - SF_USERNAME, SF_PASSWORD, SF_SECURITY_TOKEN (for Salesforce)
     - AZURE_SQL_CONNECTION_STRING (for Azure SQL DB)
-    - AZURE_DB_BATCH_SIZE (optional, defaults to 5 if not set or invalid)
+    - AZURE_DB_BATCH_SIZE (optional, rows per staged MERGE, defaults to 1000 if not set or invalid)
+    - SF_SESSION_MAX_AGE_SECONDS (optional, how long a Salesforce login is reused by later syncs, defaults to 28800)
 
     Args:
         username (str): Salesforce username.
@@ -520,32 +1131,27 @@ def download_content_document_links_to_sql_batched(
                                   Defaults to False (production).
 
     Returns:
-        list: A list of dictionaries containing the processed records
-              (including SQL update status).
-              Returns None if a critical error occurs.
+        dict: Summary of the run: 'processed' (records read from Salesforce), 'merged' (rows
+              affected by the batch MERGEs) and 'errors' (only the records that were not written:
+              skipped for missing data, failed in processing or in a failed batch, with their
+              SqlUpdateStatus/ProcessingError). Successfully merged records are not kept.
+              Returns None if no records were found or a critical error occurs.
     """
     sf = None
     cnxn = None
 
     try:
+        # --- Validate and normalise the fallback timestamp before connecting to anything ---
+        initial_last_sync_timestamp = _canonical_sf_timestamp(initial_last_sync_timestamp)
+
         # --- Read Batch Size from Environment Variable ---
-        db_batch_size_str = os.environ.get('AZURE_DB_BATCH_SIZE', '50') 
-        try:
-            db_batch_size = int(db_batch_size_str)
-            if db_batch_size <= 0:
-                raise ValueError("Batch size must be a positive integer.")
-        except ValueError as e:
-            print(f"Warning: Invalid AZURE_DB_BATCH_SIZE environment variable '{db_batch_size_str}'. Defaulting to 5. Error: {e}")
-            db_batch_size = 5
+        # Batches are staged with fast_executemany, so the size is not bound by the SQL Server
+        # parameter limit; larger batches mean fewer round-trips and commits per synced link.
+        db_batch_size = _get_positive_int_env('AZURE_DB_BATCH_SIZE', 1000)
 
         # --- Salesforce Connection ---
-        sf = Salesforce(
-            username=username,
-            password=password,
-            security_token=security_token,
-            domain='test' if sandbox else 'login'
-        )
-        print(f"Successfully connected to Salesforce. API version: {sf.api_version}")
+        sf = _get_salesforce_client(username, password, security_token, sandbox)
+        logger.info("Successfully connected to Salesforce. API version: %s", sf.api_version)
 
         # --- Azure SQL Database Setup ---
         azure_sql_connection_string = os.environ.get('AZURE_SQL_CONNECTION_STRING')
@@ -555,36 +1161,38 @@ def download_content_document_links_to_sql_batched(
                 "Environment variable AZURE_SQL_CONNECTION_STRING must be set for Azure SQL Database connection."
             )
         
-        print("Connecting to Azure SQL Database using connection string...")
-        cnxn = pyodbc.connect(azure_sql_connection_string)
+        logger.info("Connecting to Azure SQL Database using connection string...")
+        cnxn = _acquire_sql_connection(azure_sql_connection_string)
         cursor = cnxn.cursor()
-        print("Successfully connected to Azure SQL Database.")
+        cursor.fast_executemany = True # Used by _execute_cdl_db_batch to stage each batch in one round-trip
+        logger.info("Successfully connected to Azure SQL Database.")
 
         # --- Determine the actual start timestamp for the SOQL query ---
         db_last_sync_timestamp = _get_last_sync_timestamp_from_db(cursor, 'ContentDocumentLinkSync')
         
         soql_start_timestamp = db_last_sync_timestamp if db_last_sync_timestamp else initial_last_sync_timestamp
-        print(f"Starting Salesforce ContentDocumentLink query from SystemModstamp: {soql_start_timestamp}")
+        logger.info("Starting Salesforce ContentDocumentLink query from SystemModstamp: %s", soql_start_timestamp)
 
         # --- Salesforce SOQL Query ---
         # Select fields matching the [dbo].[ContentDocumentLink] table structure
-        soql_query = (
-            f"SELECT Id, LinkedEntityId, ContentDocumentId, IsDeleted, SystemModstamp, ShareType, Visibility "
-            f"FROM ContentDocumentLink WHERE SystemModstamp > {soql_start_timestamp} "
-            f"ORDER BY SystemModstamp ASC" # Added ORDER BY clause
-        )
-        print(f"Executing SOQL query: {soql_query}")
+        soql_query = _CONTENT_DOCUMENT_LINK_SOQL_TEMPLATE.format(ts=soql_start_timestamp)
+        logger.info("Executing SOQL query: %s", soql_query)
 
         # --- Execute Bulk API Query and Process Records ---
-        job_result = sf.bulk.ContentDocumentLink.query(soql_query)
-
-        processed_records = []
-        db_update_batch = []
+        # As for ContentVersion: consume the result sets lazily, prefetching the next one in the
+        # background, so SQL batches start on the first result set and only one is held in memory.
+        sf, result_sets = _start_bulk_query(sf, 'ContentDocumentLink', soql_query,
+                                            username, password, security_token, sandbox)
+        job_result = chain.from_iterable(_prefetch_in_background(result_sets, 1))
+
+        # Only records that were not written are kept for the caller; successes are just counted
+        error_records = []
+        sql_batch = _SqlBatch(_execute_cdl_db_batch, 'ContentDocumentLink', 'MERGE', 'ContentDocumentLinkSync')
         
         record_count = 0
         sql_batch_update_count = 0
 
-        print(f"Starting ContentDocumentLink Azure SQL updates (batch size: {db_batch_size})...")
+        logger.info("Starting ContentDocumentLink Azure SQL updates (batch size: %s)...", db_batch_size)
         for record in job_result:
             record_count += 1
             cdl_id = record.get('Id')
@@ -597,7 +1205,7 @@ def download_content_document_links_to_sql_batched(
             share_type = record.get('ShareType')
             visibility = record.get('Visibility')
 
-            # Initialize status fields for the processed_records list
+            # Initialize status fields for the error_records list
             record['SqlUpdateStatus'] = 'Skipped'
             record['LastSystemModstampInBatch'] = None
             record['ProcessingError'] = None
@@ -606,136 +1214,63 @@ def download_content_document_links_to_sql_batched(
             if cdl_id and content_document_id and system_modstamp_ms is not None:
                 try:
                     # Corrected: Convert milliseconds since epoch to UTC datetime object
-                    system_modstamp_dt = datetime.fromtimestamp(float(system_modstamp_ms) / 1000, tz=timezone.utc)
+                    # (the datetime is what pyodbc binds to the DATETIME2 column)
+                    system_modstamp_ms = float(system_modstamp_ms)
+                    system_modstamp_dt = datetime.fromtimestamp(system_modstamp_ms / 1000, tz=timezone.utc)
 
                     # Add to SQL DB Update Batch
-                    db_update_batch.append((
+                    record['SqlUpdateStatus'] = 'Pending Batch Update'
+                    sql_batch.add((
                         cdl_id, linked_entity_id, content_document_id,
                         is_deleted, system_modstamp_dt, share_type, visibility
-                    ))
-                    record['SqlUpdateStatus'] = 'Pending Batch Update'
+                    ), record, system_modstamp_ms, cdl_id)
 
                     # Execute Batch Update if size reached
-                    if len(db_update_batch) >= db_batch_size:
-                        print(f"    Executing ContentDocumentLink batch MERGE for {len(db_update_batch)} records...")
-                        rows_affected = _execute_cdl_db_batch(cursor, cnxn, db_update_batch)
-                        
-                        if rows_affected >= 0:
-                            sql_batch_update_count += rows_affected
-                            
-                            max_modstamp_in_batch = None
-                            last_record_id_in_batch = None
-                            
-                            for batch_item in db_update_batch:
-                                current_modstamp_dt = batch_item[4] # SystemModstamp (datetime object) is at index 4
-                                current_record_id = batch_item[0] # Id is at index 0
-
-                                if max_modstamp_in_batch is None or current_modstamp_dt > max_modstamp_in_batch:
-                                    max_modstamp_in_batch = current_modstamp_dt
-                                    last_record_id_in_batch = current_record_id
-
-                            if max_modstamp_in_batch:
-                                max_modstamp_sf_format = max_modstamp_in_batch.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
-                                _update_sync_state(cursor, cnxn, 'ContentDocumentLinkSync', 
-                                                     last_record_id_in_batch, 
-                                                     max_modstamp_sf_format)
-
-                                for r in processed_records:
-                                    if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                                        r['SqlUpdateStatus'] = 'Success (Batched)'
-                                        r['LastSystemModstampInBatch'] = max_modstamp_sf_format
-                            else:
-                                print(f"    WARNING: No valid SystemModstamp found in batch for ContentDocumentLink sync state update.")
-                                for r in processed_records:
-                                    if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                                        r['SqlUpdateStatus'] = 'Skipped (No valid timestamp in batch)'
-                        else: # rows_affected < 0, indicating DB error
-                            for r in processed_records:
-                                if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                                    r['SqlUpdateStatus'] = 'Failed (Batched)'
-                        db_update_batch = []
+                    if len(sql_batch) >= db_batch_size:
+                        sql_batch_update_count += _flush_batch(cursor, cnxn, sql_batch, error_records=error_records)
 
                 except Exception as e:
-                    print(f"    ERROR processing ContentDocumentLink ID: {cdl_id}: {e}")
+                    logger.error("Error processing ContentDocumentLink ID: %s: %s", cdl_id, e)
                     record['ProcessingError'] = str(e)
                     record['SqlUpdateStatus'] = 'Failed (Processing Error)'
+                    error_records.append(record)
             else:
-                reason = ""
-                if not cdl_id: reason += "No Id. "
-                if not content_document_id: reason += "No ContentDocumentId. "
-                # Changed variable name in message
-                if system_modstamp_ms is None: reason += "No SystemModstamp. " 
-                record['ProcessingError'] = f"Skipped: {reason.strip()}"
+                # Only reached for incomplete rows, so the happy path above does no reason-building
+                reasons = []
+                if not cdl_id: reasons.append("No Id.")
+                if not content_document_id: reasons.append("No ContentDocumentId.")
+                if system_modstamp_ms is None: reasons.append("No SystemModstamp.")
+                record['ProcessingError'] = "Skipped: " + " ".join(reasons)
                 record['SqlUpdateStatus'] = 'Not Attempted (Missing Data)'
-            
-            processed_records.append(record)
+                error_records.append(record)
 
         # --- Execute any remaining batch updates after loop ---
-        if db_update_batch:
-            print(f"    Executing final ContentDocumentLink batch MERGE for {len(db_update_batch)} records...")
-            rows_affected = _execute_cdl_db_batch(cursor, cnxn, db_update_batch)
-            
-            if rows_affected >= 0:
-                sql_batch_update_count += rows_affected
-                
-                max_modstamp_in_batch = None
-                last_record_id_in_batch = None
-                for batch_item in db_update_batch:
-                    current_modstamp_dt = batch_item[4]
-                    current_record_id = batch_item[0]
-
-                    if max_modstamp_in_batch is None or current_modstamp_dt > max_modstamp_in_batch:
-                        max_modstamp_in_batch = current_modstamp_dt
-                        last_record_id_in_batch = current_record_id
-
-                if max_modstamp_in_batch:
-                    max_modstamp_sf_format = max_modstamp_in_batch.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
-                    _update_sync_state(cursor, cnxn, 'ContentDocumentLinkSync', 
-                                         last_record_id_in_batch, 
-                                         max_modstamp_sf_format)
-                    for r in processed_records:
-                        if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                            r['SqlUpdateStatus'] = 'Success (Batched - Final)'
-                            r['LastSystemModstampInBatch'] = max_modstamp_sf_format
-                else:
-                    print(f"    WARNING: No valid SystemModstamp found in final ContentDocumentLink batch for sync state update.")
-                    for r in processed_records:
-                        if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                            r['SqlUpdateStatus'] = 'Skipped (No valid timestamp in final batch)'
-            else: # rows_affected < 0, indicating DB error
-                for r in processed_records:
-                    if r.get('SqlUpdateStatus') == 'Pending Batch Update':
-                        r['SqlUpdateStatus'] = 'Failed (Batched - Final)'
+        sql_batch_update_count += _flush_batch(cursor, cnxn, sql_batch, final=True, error_records=error_records)
             
-        if not processed_records:
-            print(f"No ContentDocumentLink records found since the last sync timestamp ({soql_start_timestamp}), or none processed.")
+        if not record_count:
+            logger.info("No ContentDocumentLink records found since the last sync timestamp (%s), or none processed.", soql_start_timestamp)
             return None
 
-        print(f"Summary for ContentDocumentLink sync:")
-        print(f"Total ContentDocumentLink records processed: {record_count}")
-        print(f"Total SQL DB records merged via batches: {sql_batch_update_count}")
+        logger.info("Summary for ContentDocumentLink sync:")
+        logger.info("Total ContentDocumentLink records processed: %s", record_count)
+        logger.info("Total SQL DB records merged via batches: %s", sql_batch_update_count)
+        logger.info("Total ContentDocumentLink records not written: %s", len(error_records))
 
-        return processed_records
+        return {'processed': record_count, 'merged': sql_batch_update_count, 'errors': error_records}
 
     except (SalesforceError, ValueError, pyodbc.Error) as e:
-        print(f"A critical error occurred during ContentDocumentLink sync: {e}")
+        logger.error("A critical error occurred during ContentDocumentLink sync: %s", e)
+        if isinstance(e, SalesforceError):
+            # The cached session may have expired or been revoked; log in again on the next sync
+            _discard_salesforce_client(sf)
         return None
     except Exception as e:
-        print(f"An unexpected general error occurred during ContentDocumentLink sync: {e}")
+        logger.exception("An unexpected general error occurred during ContentDocumentLink sync: %s", e)
         return None
     finally:
-        if sf and hasattr(sf, 'session') and sf.session:
-            try:
-                sf.close()
-                print("Salesforce session closed.")
-            except Exception as e:
-                print(f"Error closing Salesforce session: {e}")
         if cnxn:
-            try:
-                cnxn.close()
-                print("Azure SQL Database connection closed.")
-            except Exception as e:
-                print(f"Error closing Azure SQL Database connection: {e}")
+            _release_sql_connection(azure_sql_connection_string, cnxn)
+            logger.info("Azure SQL Database connection returned to the pool.")
 
 # --- Example Usage ---
 if __name__ == "__main__":
@@ -752,7 +1287,7 @@ if __name__ == "__main__":
     
     # For Azure SQL Database:
     # export AZURE_SQL_CONNECTION_STRING="DRIVER={ODBC Driver 17 for SQL Server};SERVER=yourserver.database.windows.net;DATABASE=yourdatabase;UID=yourusername;PWD=yourpassword"
-    # export AZURE_DB_BATCH_SIZE="5" # Optional, now defaults to 5
+    # export AZURE_DB_BATCH_SIZE="1000" # Optional, defaults to 1000
 
     SF_USERNAME = os.environ.get('SF_USERNAME')
     SF_PASSWORD = os.environ.get('SF_PASSWORD')
@@ -763,6 +1298,8 @@ if __name__ == "__main__":
     INITIAL_LAST_SYNC_TIMESTAMP = '2024-01-01T00:00:00Z' 
     IS_SANDBOX = False 
 
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
     print(f"Starting ContentVersion sync process.")
     
     # Call the ContentVersion sync function
@@ -806,20 +1343,19 @@ if __name__ == "__main__":
     # )
 
     # if content_document_link_results is not None:
-    #     print("\nFinal Processed ContentDocumentLink Data (first 5 records):")
-    #     if content_document_link_results:
-    #         for i, record in enumerate(content_document_link_results[:5]):
+    #     print(f"\nContentDocumentLink records processed: {content_document_link_results['processed']}, merged: {content_document_link_results['merged']}")
+    #     error_records = content_document_link_results['errors']
+    #     if error_records:
+    #         print("\nContentDocumentLink records not written (first 5):")
+    #         for i, record in enumerate(error_records[:5]):
     #             print(f"Record {i+1}:")
     #             print(f"    Id: {record.get('Id')}")
     #             print(f"    LinkedEntityId: {record.get('LinkedEntityId')}")
     #             print(f"    ContentDocumentId: {record.get('ContentDocumentId')}")
     #             print(f"    IsDeleted: {record.get('IsDeleted')}")
     #             print(f"    SqlUpdateStatus: {record.get('SqlUpdateStatus')}")
-    #             print(f"    LastSystemModstampInBatch: {record.get('LastSystemModstampInBatch')}")
     #             print(f"    ProcessingError: {record.get('ProcessingError')}")
     #             print("-" * 20)
-    #     else:
-    #         print("No ContentDocumentLink records to display.")
-    #     print(f"\nTotal ContentDocumentLink records processed by script: {len(content_document_link_results) if content_document_link_results else 0}")
+    #     print(f"\nTotal ContentDocumentLink records not written: {len(error_records)}")
     # else:
     #     print("ContentDocumentLink sync terminated due to a critical error.")
\ No newline at end of file
@@ -61,20 +61,19 @@ def lendz_sync_salesforce_contentdocumentlink(myTimer: func.TimerRequest) -> Non
     )
 
     if content_document_link_results is not None:
-        print("\nFinal Processed ContentDocumentLink Data (first 5 records):")
-        if content_document_link_results:
-            for i, record in enumerate(content_document_link_results[:5]):
+        print(f"\nContentDocumentLink records processed: {content_document_link_results['processed']}, merged: {content_document_link_results['merged']}")
+        error_records = content_document_link_results['errors']
+        if error_records:
+            print("\nContentDocumentLink records not written (first 5):")
+            for i, record in enumerate(error_records[:5]):
                 print(f"Record {i+1}:")
                 print(f"    Id: {record.get('Id')}")
                 print(f"    LinkedEntityId: {record.get('LinkedEntityId')}")
                 print(f"    ContentDocumentId: {record.get('ContentDocumentId')}")
                 print(f"    IsDeleted: {record.get('IsDeleted')}")
                 print(f"    SqlUpdateStatus: {record.get('SqlUpdateStatus')}")
-                print(f"    LastSystemModstampInBatch: {record.get('LastSystemModstampInBatch')}")
                 print(f"    ProcessingError: {record.get('ProcessingError')}")
                 print("-" * 20)
-        else:
-            print("No ContentDocumentLink records to display.")
-        print(f"\nTotal ContentDocumentLink records processed by script: {len(content_document_link_results) if content_document_link_results else 0}")
+        print(f"\nTotal ContentDocumentLink records not written: {len(error_records)}")
     else:
-        print("ContentDocumentLink sync terminated due to a critical error.") 
\ No newline at end of file
+        print("ContentDocumentLink sync terminated due to a critical error.")
\ No newline at end of file